@@ -1,14 +1,60 @@
 from dataclasses import dataclass
 
+import numpy as np
+
 @dataclass
 class AxisSpec:
+    '''
+        Axis binning. Uniform by default, logarithmic if log is True,
+        variable width if the bin edges are given (nbins, xmin, xmax are then taken from the edges)
+    '''
 
     nbins: int
     xmin: float
     xmax: float
     name: str = ''
     title: str = ''
+    edges: tuple = None
+    log: bool = False
+
+    def __post_init__(self):
+
+        if self.edges is not None:
+            edges = np.asarray(self.edges, dtype=np.float64)
+            if edges.ndim != 1 or len(edges) < 2 or np.any(np.diff(edges) <= 0):
+                raise ValueError('Bin edges must be a strictly increasing sequence of at least two values')
+            self.edges = tuple(edges.tolist())
+            self.nbins, self.xmin, self.xmax = len(edges) - 1, self.edges[0], self.edges[-1]
+        elif self.log and self.xmin <= 0:
+            raise ValueError('Logarithmic binning requires xmin > 0')
+
+    @property
+    def isUniform(self) -> bool:
+        return self.edges is None and not self.log
+
+    @property
+    def binEdges(self) -> np.ndarray:
+        '''
+            Array of the nbins+1 bin edges
+        '''
+        if self.edges is not None:  return np.array(self.edges, dtype=np.float64)
+        if self.log:                return np.geomspace(self.xmin, self.xmax, self.nbins + 1)
+        return np.linspace(self.xmin, self.xmax, self.nbins + 1)
 
     @classmethod
     def from_dict(cls, d: dict):
-        return cls(d['nbins'], d['xmin'], d['xmax'], d['name'], d['title'])
\ No newline at end of file
+        if 'edges' in d:    return cls.from_edges(d['edges'], d.get('name', ''), d.get('title', ''))
+        return cls(d['nbins'], d['xmin'], d['xmax'], d['name'], d['title'], log=d.get('log', False))
+
+    @classmethod
+    def from_edges(cls, edges, name: str = '', title: str = ''):
+        return cls(len(edges) - 1, edges[0], edges[-1], name, title, edges=edges)
+
+    @classmethod
+    def from_taxis(cls, axis, name: str = '', title: str = ''):
+        '''
+            Binning of a ROOT TAxis
+        '''
+        xbins = axis.GetXbins()
+        if xbins.GetSize() == 0:    return cls(axis.GetNbins(), axis.GetXmin(), axis.GetXmax(), name, title)
+        return cls.from_edges([xbins.At(ibin) for ibin in range(xbins.GetSize())], name, title)
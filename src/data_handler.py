@@ -5,9 +5,12 @@
 from abc import ABC, abstractmethod
 
 import uproot
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 from hipe4ml.tree_handler import TreeHandler
 
+from .selection import Selection
 from ..utils.terminal_colors import TerminalColors as tc
 
 class DataHandler:
@@ -23,17 +26,35 @@ class DataHandler:
 class TableHandler(DataHandler): 
     '''
         Class to open data from AO2D.root files generated with a O2Physics table producer
+
+        Parameters
+        ----------
+        inFilePath (str or list): path (or list of paths) to the input AO2D.root files
+        treeName (str): name of the tree
+        dirPrefix (str): prefix of the directories containing the tree
+        downcast (bool): downcast integer columns to the smallest dtype holding their values (lossless)
+        float32Columns (list): float columns to be stored as float32. This is lossy: values are rounded 
+                               to single precision
+        categoricalColumns (list): columns to be stored as pandas categoricals (not downcast)
+        flagColumns (dict): {bitfield column: [boolean columns]}. The boolean columns are packed 
+                            in a single unsigned integer column and dropped (bit i is the i-th column)
+        kwargs: passed to hipe4ml TreeHandler
     '''
-    def __init__(self, inFilePath: str, treeName: str, dirPrefix: str, **kwargs):
+    def __init__(self, inFilePath: str, treeName: str, dirPrefix: str, downcast: bool = False, float32Columns: list = None, categoricalColumns: list = None, flagColumns: dict = None, **kwargs):
 
         self.inFilePath = inFilePath
+        self.downcast = downcast
+        self.float32Columns = float32Columns if float32Columns is not None else []
+        self.categoricalColumns = categoricalColumns if categoricalColumns is not None else []
+        self.flagColumns = flagColumns if flagColumns is not None else {}
+
         if type(self.inFilePath) is str:
-            self.inData = self._open(inFilePath, treeName, dirPrefix, **kwargs)
+            self.inData = self._compactDtypes(self._open(inFilePath, treeName, dirPrefix, **kwargs))
         elif type(self.inFilePath) is list:
             dfs = []
             for f in inFilePath:
-                dfs.append(self._open(f, treeName, dirPrefix, **kwargs))
-            self.inData = pd.concat(dfs)
+                dfs.append(self._compactDtypes(self._open(f, treeName, dirPrefix, **kwargs)))
+            self.inData = self._concat(dfs)
 
     def _open(self, inFilePath: str, treeName: str, dirPrefix: str, **kwargs):
 
@@ -46,6 +67,113 @@ class TableHandler(DataHandler):
 
         else:   raise ValueError(tc.RED+'[ERROR]:'+tc.RESET+' File extension not supported')
 
+    def _compactDtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+        '''
+            Convert the columns of a single file to compact dtypes before they are concatenated
+        '''
+
+        for col in df.columns:
+            # flags read as objects (True/False) are restored to bool
+            if df[col].dtype == object and df[col].map(type).isin([bool, np.bool_]).all():
+                df[col] = df[col].astype(bool)
+
+        # categoricals are converted first, so that their categories keep the source dtype in all the files
+        for col in self.categoricalColumns:
+            if col in df.columns:  df[col] = df[col].astype('category')
+
+        # the integer dtype may differ between files, _concat restores the widest one
+        if self.downcast:
+            for col in df.select_dtypes(include='signedinteger').columns:
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+            for col in df.select_dtypes(include='unsignedinteger').columns:
+                df[col] = pd.to_numeric(df[col], downcast='unsigned')
+
+        for col in self.float32Columns:
+            if col in df.columns:  df[col] = df[col].astype(np.float32)
+
+        for bitfield, flags in self.flagColumns.items():
+            if len(flags) > 64:    raise ValueError(tc.RED+'[ERROR]:'+tc.RESET+f' Too many flags for bitfield {bitfield} (max 64)')
+            bitDtype = np.dtype(np.min_scalar_type((1 << len(flags)) - 1))
+            packed = np.zeros(len(df), dtype=bitDtype)
+            for ibit, flag in enumerate(flags):
+                packed |= (df[flag].to_numpy(dtype=bool).astype(bitDtype) << bitDtype.type(ibit))
+            df = df.drop(columns=flags)
+            df[bitfield] = packed
+
+        return df
+
+    def _concat(self, dfs: list) -> pd.DataFrame:
+        '''
+            Concatenate the dataframes from different files, without upcasting the column dtypes
+        '''
+
+        # categoricals are only preserved by pd.concat if their categories coincide
+        for col in dfs[0].select_dtypes(include='category').columns:
+            # numerical categories must share the same dtype to be merged
+            categoryDtypes = [df[col].cat.categories.dtype for df in dfs if col in df.columns]
+            if all(isinstance(dtype, np.dtype) for dtype in categoryDtypes):
+                categoryDtype = np.result_type(*categoryDtypes)
+                for df in dfs:
+                    if col in df.columns:  df[col] = df[col].cat.set_categories(df[col].cat.categories.astype(categoryDtype))
+            categories = union_categoricals([df[col] for df in dfs if col in df.columns]).categories
+            for df in dfs:
+                if col in df.columns:  df[col] = df[col].cat.set_categories(categories)
+
+        dtypes = {col: np.result_type(*[df[col].dtype for df in dfs if col in df.columns]) 
+                  for col in dfs[0].columns if not isinstance(dfs[0][col].dtype, pd.CategoricalDtype)}
+        inData = pd.concat(dfs)
+        for col, dtype in dtypes.items():
+            # columns missing in some file are filled with NaN and cannot be restored
+            if inData[col].dtype != dtype and not inData[col].isna().any():
+                inData[col] = inData[col].astype(dtype)
+
+        return inData
+
+    def getFlag(self, bitfield: str, flag: str) -> np.ndarray:
+        '''
+            Unpack a single flag from a bitfield column created with flagColumns
+
+            Parameters
+            ----------
+            bitfield (str): name of the bitfield column
+            flag (str): name of the original boolean column
+        '''
+
+        ibit = self.flagColumns[bitfield].index(flag)
+        packed = self.inData[bitfield].to_numpy()
+        return ((packed >> packed.dtype.type(ibit)) & packed.dtype.type(1)).astype(bool)
+
+    def applySelection(self, selection: Selection, addColumns: bool = True) -> dict:
+        '''
+            Compute the derived variables and the cut masks of a Selection on the loaded data.
+            The masks can be passed to DFHistHandler to fill histograms with the selected rows only
+
+            Parameters
+            ----------
+            selection (Selection): derived variables and cuts
+            addColumns (bool): add the derived variables as columns of the loaded data
+        '''
+
+        return selection.evaluate(self.inData, addColumns)
+
+    def memoryUsage(self, verbose: bool = True) -> pd.Series:
+        '''
+            Memory used by each column of the loaded data (in bytes)
+
+            Parameters
+            ----------
+            verbose (bool): print a per-column summary
+        '''
+
+        usage = self.inData.memory_usage(index=True, deep=True)
+        if verbose:
+            print(tc.GREEN+'[INFO]: '+tc.RESET+'Memory usage per column')
+            for col, nbytes in usage.items():
+                dtype = self.inData[col].dtype if col in self.inData.columns else self.inData.index.dtype
+                print(f'    {col:<30} {str(dtype):<12} {nbytes/1024**2:>10.2f} MB')
+            print(tc.GREEN+'[INFO]: '+tc.RESET+'Total memory usage: '+tc.BOLD+f'{usage.sum()/1024**2:.2f} MB'+tc.RESET)
+        return usage
+
 class TaskHandler(DataHandler):
     '''
         Class to open data from AO2D.root files generated with a O2Physics task
@@ -0,0 +1,99 @@
+'''
+    Class to keep a bounded number of ROOT files open
+'''
+
+import os
+from collections import OrderedDict
+
+from ROOT import TFile, TDirectory
+
+
+class TFileCache:
+    '''
+        Least recently used cache of open TFile handles. When more than maxSize files
+        are open, the least recently used one is closed. A cached handle is reopened if the
+        file was modified on disk (modification time or size changed) since it was opened.
+
+        Parameters
+        ----------
+        maxSize (int): maximum number of files kept open
+    '''
+
+    def __init__(self, maxSize: int = 8):
+
+        if maxSize < 1: raise ValueError('The cache must hold at least one file')
+        self.maxSize = maxSize
+        self.__files = OrderedDict()
+
+    def __len__(self):
+        return len(self.__files)
+
+    def __contains__(self, filePath: str):
+        return filePath in self.__files
+
+    @staticmethod
+    def fileStamp(filePath: str):
+        '''
+            Modification time and size of a local file (None for remote or missing files)
+        '''
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, filePath: str) -> TFile:
+        '''
+            Return an open handle to the file, opening it if it is not in the cache or if it was modified
+        '''
+
+        if filePath in self.__files:
+            tfile, stamp = self.__files[filePath]
+            if stamp == self.fileStamp(filePath):
+                self.__files.move_to_end(filePath)
+                return tfile
+            # the file was rewritten, the open handle would read stale keys
+            self.close(filePath)
+
+        stamp = self.fileStamp(filePath)
+
+        # opening a file makes it the current directory: restore the previous one, so that objects
+        # created later are not attached to (and deleted with) the cached file
+        with TDirectory.TContext():
+            tfile = TFile.Open(filePath, 'READ')
+        if not tfile or tfile.IsZombie():  raise ValueError(f'Could not open {filePath}')
+        self.__files[filePath] = (tfile, stamp)
+        self._evict()
+        return tfile
+
+    def resize(self, maxSize: int):
+        '''
+            Change the maximum number of files kept open, closing the exceeding ones
+        '''
+
+        if maxSize < 1: raise ValueError('The cache must hold at least one file')
+        self.maxSize = maxSize
+        self._evict()
+
+    def close(self, filePath: str):
+        '''
+            Close a single file, if open
+        '''
+
+        cached = self.__files.pop(filePath, None)
+        if cached is not None:  cached[0].Close()
+
+    def clear(self):
+        '''
+            Close all the open files
+        '''
+
+        while self.__files:
+            _, (tfile, _) = self.__files.popitem(last=False)
+            tfile.Close()
+
+    def _evict(self):
+
+        while len(self.__files) > self.maxSize:
+            _, (tfile, _) = self.__files.popitem(last=False)
+            tfile.Close()
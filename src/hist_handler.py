@@ -9,6 +9,9 @@ from ROOT import TH1F, TH2F, TFile, TH1
 
 from .axis_spec import AxisSpec
 from .hist_info import HistLoadInfo
+from .hist_merger import HistMerger
+from .file_cache import TFileCache
+from .parallel_fill import fillHist
 
 class THist:
     '''
@@ -17,8 +20,14 @@ class THist:
     def __init__(self, axisSpecs):
 
         self.__hist = None
-        if len(axisSpecs) == 1:     self.__hist = TH1F(axisSpecs[0].name, axisSpecs[0].title, axisSpecs[0].nbins, axisSpecs[0].xmin, axisSpecs[0].xmax)
-        elif len(axisSpecs) == 2:   self.__hist = TH2F(axisSpecs[0].name, axisSpecs[0].title, axisSpecs[0].nbins, axisSpecs[0].xmin, axisSpecs[0].xmax, axisSpecs[1].nbins, axisSpecs[1].xmin, axisSpecs[1].xmax)
+        if len(axisSpecs) == 1:
+            if axisSpecs[0].isUniform:  self.__hist = TH1F(axisSpecs[0].name, axisSpecs[0].title, axisSpecs[0].nbins, axisSpecs[0].xmin, axisSpecs[0].xmax)
+            else:                       self.__hist = TH1F(axisSpecs[0].name, axisSpecs[0].title, axisSpecs[0].nbins, axisSpecs[0].binEdges)
+        elif len(axisSpecs) == 2:
+            # non-uniform axes are built from the bin edges, uniform ones stay uniform
+            xBinning = (axisSpecs[0].xmin, axisSpecs[0].xmax) if axisSpecs[0].isUniform else (axisSpecs[0].binEdges,)
+            yBinning = (axisSpecs[1].xmin, axisSpecs[1].xmax) if axisSpecs[1].isUniform else (axisSpecs[1].binEdges,)
+            self.__hist = TH2F(axisSpecs[0].name, axisSpecs[0].title, axisSpecs[0].nbins, *xBinning, axisSpecs[1].nbins, *yBinning)
         else:                       raise ValueError('Lenght of the axes specifics list must be one or two')
 
     @property
@@ -38,18 +47,120 @@ class HistHandler(ABC):
         elif str(type(inData)) == "<class 'pandas.core.frame.DataFrame'>":      return DFHistHandler(inData)
         else:                                                                   raise ValueError('Data type not supported. Input data has type '+str(type(inData)))
 
+    # open input files and memoized objects, shared by all the handlers in the process
+    fileCache = TFileCache(maxSize=8)
+    _histMemo = {}
+
     @classmethod
-    def loadHist(cls, histInfo: HistLoadInfo) -> TH1:
+    def loadHist(cls, histInfo: HistLoadInfo, memoize: bool = False) -> TH1:
         '''
-            Load histogram from file
+            Load histogram from file. The file is kept open in the file cache.
+
+            Parameters
+            ----------
+            histInfo (HistLoadInfo): file and name of the histogram
+            memoize (bool): keep the loaded histogram in memory, so that later calls return the 
+                            same object (modifications to it are then seen by all the callers).
+                            The memoized object is dropped if the file is modified
         '''
-        histFile = TFile(histInfo.hist_file_path)
-        hist = histFile.Get(histInfo.hist_name)
-        hist.SetDirectory(0)
-        histFile.Close()
+        key = (histInfo.hist_file_path, histInfo.hist_name)
+        hist = cls._memoized(key)
+        if hist is not None:    return hist
+
+        histFile = cls.fileCache.get(histInfo.hist_file_path)
+        hist = cls._readObj(histFile, histInfo.hist_name)
+        if memoize: cls._memoize(key, hist)
 
         return hist
 
+    @classmethod
+    def loadHists(cls, histInfos: list, memoize: bool = False) -> list:
+        '''
+            Load a list of histograms. Requests are grouped by file and each object is read once:
+            repeated requests in the same call get a clone of the first one (unless memoized).
+
+            Parameters
+            ----------
+            histInfos (list[HistLoadInfo]): files and names of the histograms
+            memoize (bool): keep the loaded histograms in memory (see loadHist)
+
+            Returns
+            -------
+            list: histograms, in the same order as histInfos
+        '''
+        requests = {}
+        for ihist, histInfo in enumerate(histInfos):
+            requests.setdefault(histInfo.hist_file_path, {}).setdefault(histInfo.hist_name, []).append(ihist)
+
+        hists = [None] * len(histInfos)
+        for histFilePath, names in requests.items():
+            histFile = None
+            for histName, ihists in names.items():
+                key = (histFilePath, histName)
+                hist = cls._memoized(key)
+                if hist is None:
+                    if histFile is None:    histFile = cls.fileCache.get(histFilePath)
+                    hist = cls._readObj(histFile, histName)
+                    if memoize: cls._memoize(key, hist)
+
+                hists[ihists[0]] = hist
+                for ihist in ihists[1:]:
+                    if key in cls._histMemo:
+                        hists[ihist] = hist
+                    else:
+                        hists[ihist] = hist.Clone()
+                        hists[ihist].SetDirectory(0)
+
+        return hists
+
+    @classmethod
+    def clearCache(cls):
+        '''
+            Close all the cached files and drop the memoized histograms
+        '''
+        cls.fileCache.clear()
+        cls._histMemo.clear()
+
+    @classmethod
+    def _memoize(cls, key: tuple, hist):
+        cls._histMemo[key] = (TFileCache.fileStamp(key[0]), hist)
+
+    @classmethod
+    def _memoized(cls, key: tuple):
+        '''
+            Memoized object, if any and if its file was not modified since it was read
+        '''
+        if key not in cls._histMemo:    return None
+        stamp, hist = cls._histMemo[key]
+        if stamp != TFileCache.fileStamp(key[0]):
+            del cls._histMemo[key]
+            return None
+        return hist
+
+    @staticmethod
+    def _readObj(histFile: TFile, histName: str) -> TH1:
+
+        hist = histFile.Get(histName)
+        if not hist:    raise ValueError(f'{histName} not found in {histFile.GetName()}')
+        hist.SetDirectory(0)
+        return hist
+
+    @classmethod
+    def mergeFiles(cls, inFilePaths: list, outFilePath: str, nWorkers: int = None) -> list:
+        '''
+            Merge the histograms (and the other objects, see HistMerger) found in the input files
+            and write them to a single output file
+
+            Parameters
+            ----------
+            inFilePaths (list): paths to the partial output files
+            outFilePath (str): path to the merged output file
+            nWorkers (int): number of worker processes (default: number of cpus)
+        '''
+        # a cached handle to the output file would not see the merged objects
+        cls.fileCache.close(outFilePath)
+        return HistMerger(inFilePaths, nWorkers).merge(outFilePath)
+
     @abstractmethod
     def buildTH1(self, xVariable, axisSpecX): 
         return NotImplemented
@@ -66,7 +177,7 @@ class HistHandler(ABC):
 
         if 'TH1' in str(type(partialHist)):
             
-            axisSpecX = AxisSpec(partialHist.GetNbinsX(), partialHist.GetXaxis().GetXmin(), partialHist.GetXaxis().GetXmax(), partialHist.GetName()+'Eff', partialHist.GetName()+'Efficiency')
+            axisSpecX = AxisSpec.from_taxis(partialHist.GetXaxis(), partialHist.GetName()+'Eff', partialHist.GetName()+'Efficiency')
             hEff = THist([axisSpecX]).hist
 
             for xbin in range(1, totalHist.GetNbinsX()):
@@ -83,8 +194,8 @@ class HistHandler(ABC):
 
         elif 'TH2' in str(type(partialHist)):
 
-            axisSpecX = AxisSpec(partialHist.GetNbinsX(), partialHist.GetXaxis().GetXmin(), partialHist.GetXaxis().GetXmax(), partialHist.GetName()+'Eff', partialHist.GetName()+' Efficiency')
-            axisSpecY = AxisSpec(partialHist.GetNbinsY(), partialHist.GetYaxis().GetXmin(), partialHist.GetYaxis().GetXmax(), partialHist.GetName()+'Eff', partialHist.GetName()+' Efficiency')
+            axisSpecX = AxisSpec.from_taxis(partialHist.GetXaxis(), partialHist.GetName()+'Eff', partialHist.GetName()+' Efficiency')
+            axisSpecY = AxisSpec.from_taxis(partialHist.GetYaxis(), partialHist.GetName()+'Eff', partialHist.GetName()+' Efficiency')
             hEff = THist([axisSpecX, axisSpecY]).hist 
 
             for ybin in range(1, partialHist.GetNbinsY() + 1):   
@@ -134,16 +245,40 @@ class DFHistHandler(HistHandler):
     def __init__(self, inData):
         self.inData = inData
 
-    def buildTH1(self, xVariable: str, axisSpecX: AxisSpec) -> TH1F:
+    def buildTH1(self, xVariable: str, axisSpecX: AxisSpec, mask: np.ndarray = None, nWorkers: int = None, chunkSize: int = 1 << 22) -> TH1F:
+        '''
+            mask: boolean array (e.g. from Selection), only the selected rows are used
+            nWorkers: if given, fill in chunks of chunkSize rows on nWorkers processes (see parallel_fill.fillHist)
+                      Non-uniform axes are always filled with the vectorized bin search
+        '''
         hist = THist([axisSpecX]).hist
-        for x in self.inData[xVariable]:    hist.Fill(x)
+        if nWorkers is None and not axisSpecX.isUniform:  nWorkers = 1
+        if nWorkers is not None:    return fillHist(hist, [self.inData[xVariable].to_numpy()], [axisSpecX], mask, nWorkers, chunkSize)
+        for x in self._values(xVariable, mask):    hist.Fill(x)
         return hist
     
-    def buildTH2(self, xVariable: str, yVariable: str, axisSpecX: AxisSpec, axisSpecY: AxisSpec) -> TH1F:
+    def buildTH2(self, xVariable: str, yVariable: str, axisSpecX: AxisSpec, axisSpecY: AxisSpec, mask: np.ndarray = None, nWorkers: int = None, chunkSize: int = 1 << 22) -> TH1F:
+        '''
+            mask: boolean array (e.g. from Selection), only the selected rows are used
+            nWorkers: if given, fill in chunks of chunkSize rows on nWorkers processes (see parallel_fill.fillHist).
+                      The result does not depend on nWorkers. Non-uniform axes are always filled with the vectorized bin search
+        '''
         hist = THist([axisSpecX, axisSpecY]).hist
-        for x, y in zip(self.inData[xVariable], self.inData[yVariable]):    hist.Fill(x, y)
+        if nWorkers is None and not (axisSpecX.isUniform and axisSpecY.isUniform):  nWorkers = 1
+        if nWorkers is not None:    
+            return fillHist(hist, [self.inData[xVariable].to_numpy(), self.inData[yVariable].to_numpy()], [axisSpecX, axisSpecY], mask, nWorkers, chunkSize)
+        for x, y in zip(self._values(xVariable, mask), self._values(yVariable, mask)):    hist.Fill(x, y)
         return hist
 
+    def _values(self, variable: str, mask: np.ndarray = None) -> np.ndarray:
+        '''
+            Values of a column, restricted to the selected rows (without copying the whole dataframe)
+        '''
+        values = self.inData[variable].to_numpy()
+        if mask is None:    return values
+        if len(mask) != len(values):    raise ValueError(f'Mask length ({len(mask)}) does not match the data length ({len(values)})')
+        return values[mask]
+
         
 
 class UprootHistHandler(HistHandler):
@@ -0,0 +1,315 @@
+'''
+    Class to merge the histograms stored in many partial output files
+'''
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from ROOT import TFile, TClass, TList
+
+from .parallel_fill import N_STATS
+from ..utils.terminal_colors import TerminalColors as tc
+
+# how the objects found in the input files are merged
+SUM = 'sum'         # histograms, summed as arrays on the process pool
+MERGE = 'merge'     # profiles and THn, merged with their Merge method
+COPY = 'copy'       # other objects (canvases, graphs, functions...), copied from the first file containing them
+SKIP = 'skip'       # trees and classes without a dictionary, not merged
+
+
+def _mergeMode(className: str) -> str:
+
+    objClass = TClass.GetClass(className)
+    # classes without a dictionary cannot be read back
+    if not objClass:                        return SKIP
+    if objClass.InheritsFrom('TProfile') or objClass.InheritsFrom('TProfile2D') or objClass.InheritsFrom('TProfile3D'):
+        return MERGE
+    if objClass.InheritsFrom('TH1'):        return SUM
+    if objClass.InheritsFrom('THnBase'):    return MERGE
+    if objClass.InheritsFrom('TTree'):      return SKIP
+    return COPY
+
+def _listObjects(directory, prefix: str = '') -> dict:
+    '''
+        List the objects stored (recursively) in a ROOT directory
+
+        Returns
+        -------
+        dict: {object path: merge mode}
+    '''
+
+    objects = {}
+    for key in directory.GetListOfKeys():
+        # keys are sorted by cycle, only the most recent one is kept
+        path = prefix + key.GetName()
+        if path in objects: continue
+
+        objClass = TClass.GetClass(key.GetClassName())
+        if objClass and objClass.InheritsFrom('TDirectory'):
+            objects.update(_listObjects(key.ReadObj(), path + '/'))
+        else:
+            objects[path] = _mergeMode(key.GetClassName())
+    return objects
+
+def _axesOf(hist) -> tuple:
+    '''
+        Number of bins, limits, variable bin edges and labels of each axis of a histogram
+    '''
+
+    axes = []
+    for axis in [hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis()][:hist.GetDimension()]:
+        xbins = axis.GetXbins()
+        edges = tuple(xbins.At(ibin) for ibin in range(xbins.GetSize()))
+        labels = tuple(label.GetName() for label in axis.GetLabels()) if axis.GetLabels() else ()
+        axes.append((axis.GetNbins(), axis.GetXmin(), axis.GetXmax(), edges, labels))
+    return tuple(axes)
+
+def _toBuffers(hist) -> dict:
+    '''
+        Copy the bin contents, sum of squared weights and statistics of a histogram to numpy arrays
+    '''
+
+    ncells = hist.GetNcells()
+    contents = hist.GetArray()
+    contents.reshape((ncells,))
+    buffers = {'axes': _axesOf(hist), 'contents': np.array(contents, dtype=np.float64), 'sumw2': None}
+
+    if hist.GetSumw2N() > 0:
+        sumw2 = hist.GetSumw2().GetArray()
+        sumw2.reshape((ncells,))
+        buffers['sumw2'] = np.array(sumw2, dtype=np.float64)
+
+    stats = np.zeros(N_STATS, dtype=np.float64)
+    hist.GetStats(stats)
+    buffers['stats'] = stats
+    buffers['entries'] = hist.GetEntries()
+    return buffers
+
+def _sumBuffers(partial: dict, other: dict, path: str = '') -> dict:
+    '''
+        Add the buffers of two histograms with the same binning, in place on the first one
+    '''
+
+    if partial['axes'] != other['axes']:
+        raise ValueError(f'{path}: histograms with different binning (or bin labels) cannot be summed')
+
+    if partial['sumw2'] is not None or other['sumw2'] is not None:
+        # without a sumw2 array, the histogram was filled with unit weights
+        sumw2 = partial['sumw2'] if partial['sumw2'] is not None else partial['contents'].copy()
+        sumw2 += other['sumw2'] if other['sumw2'] is not None else other['contents']
+        partial['sumw2'] = sumw2
+    partial['contents'] += other['contents']
+    partial['stats'] += other['stats']
+    partial['entries'] += other['entries']
+    return partial
+
+def _sumPartials(partials: list) -> dict:
+    '''
+        Sum a list of histogram sets ({path: buffers})
+    '''
+
+    result = partials[0]
+    for partial in partials[1:]:
+        for path, buffers in partial.items():
+            # a histogram may be missing from some of the files
+            if path in result:  _sumBuffers(result[path], buffers, path)
+            else:               result[path] = buffers
+    return result
+
+def _sumFiles(inFilePaths: list, histPaths: list) -> dict:
+    '''
+        Sum the histograms of a group of files. Only one file is open at a time,
+        so that the memory stays bounded by the size of a single histogram set.
+        Histograms missing from a file are skipped for that file
+    '''
+
+    result = None
+    for inFilePath in inFilePaths:
+        inFile = TFile.Open(inFilePath, 'READ')
+        if not inFile or inFile.IsZombie():    raise ValueError(f'Could not open {inFilePath}')
+
+        partial = {}
+        for path in histPaths:
+            hist = inFile.Get(path)
+            if not hist:    continue
+            partial[path] = _toBuffers(hist)
+            hist.Delete()
+        inFile.Close()
+
+        result = partial if result is None else _sumPartials([result, partial])
+    return result
+
+
+class HistMerger:
+    '''
+        Merge the objects stored in many partial output files (e.g. from grid productions).
+        Each object is merged over the files that contain it (as hadd does):
+            - histograms are summed with a tree reduction on a process pool, working on
+              the bin content arrays rather than on the ROOT objects
+            - profiles and THn are merged with their Merge method, one file at a time
+            - other objects (canvases, graphs, functions) are copied from the first file containing them
+            - trees (and classes without a dictionary) are not merged
+
+        Parameters
+        ----------
+        inFilePaths (list): paths to the partial output files
+        nWorkers (int): number of worker processes (default: number of cpus)
+    '''
+
+    def __init__(self, inFilePaths: list, nWorkers: int = None):
+
+        if len(inFilePaths) == 0:   raise ValueError('No input file to merge')
+        self.inFilePaths = list(inFilePaths)
+        self.nWorkers = nWorkers
+        # path of the first file containing each object, used as template for the output
+        self.templates, self.modes = self._findObjects()
+        self.histPaths = [path for path, mode in self.modes.items() if mode == SUM]
+
+    def _findObjects(self) -> tuple:
+        '''
+            Find the objects stored in any of the input files
+
+            Returns
+            -------
+            tuple: ({object path: path of the first file containing it}, {object path: merge mode})
+        '''
+
+        templates = {}
+        modes = {}
+        nPartial = 0
+        for inFilePath in self.inFilePaths:
+            inFile = TFile.Open(inFilePath, 'READ')
+            if not inFile or inFile.IsZombie():    raise ValueError(f'Could not open {inFilePath}')
+            objects = _listObjects(inFile)
+            inFile.Close()
+
+            if len(templates) > 0 and len(set(templates) - set(objects)) > 0:    nPartial += 1
+            for path, mode in objects.items():
+                templates.setdefault(path, inFilePath)
+                modes.setdefault(path, mode)
+
+        if nPartial > 0:
+            print(tc.YELLOW+'[WARNING]: '+tc.RESET+f'{nPartial} files do not contain all the objects, they are merged over the files containing them')
+        copied = [path for path, mode in modes.items() if mode == COPY]
+        if len(copied) > 0:
+            print(tc.YELLOW+'[WARNING]: '+tc.RESET+'Objects copied from the first file containing them (not merged): '+', '.join(copied))
+        skipped = [path for path, mode in modes.items() if mode == SKIP]
+        if len(skipped) > 0:
+            print(tc.YELLOW+'[WARNING]: '+tc.RESET+'Trees and objects without a dictionary are not merged, skipping: '+', '.join(skipped))
+
+        return templates, modes
+
+    def _reduce(self) -> dict:
+        '''
+            Sum the histograms of all files. Each worker sums a group of files sequentially,
+            then the partial results are summed pairwise until a single set is left
+        '''
+
+        nWorkers = self.nWorkers if self.nWorkers is not None else os.cpu_count()
+        with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            nGroups = min(nWorkers, len(self.inFilePaths))
+            groups = [self.inFilePaths[igroup::nGroups] for igroup in range(nGroups)]
+            partials = list(executor.map(_sumFiles, groups, [self.histPaths]*nGroups))
+
+            while len(partials) > 1:
+                pairs = [partials[ipartial:ipartial+2] for ipartial in range(0, len(partials), 2)]
+                partials = list(executor.map(_sumPartials, pairs))
+
+        return partials[0]
+
+    def _mergeObjects(self, paths: list) -> dict:
+        '''
+            Merge objects with their Merge method, reading one file at a time
+        '''
+
+        merged = {}
+        for inFilePath in self.inFilePaths:
+            inFile = TFile.Open(inFilePath, 'READ')
+            for path in paths:
+                obj = inFile.Get(path)
+                if not obj: continue
+                if path not in merged:
+                    if obj.InheritsFrom('TH1'):    obj.SetDirectory(0)
+                    merged[path] = obj
+                    continue
+                others = TList()
+                others.Add(obj)
+                merged[path].Merge(others)
+            inFile.Close()
+        return merged
+
+    def _templateGroups(self, mode: str) -> dict:
+        '''
+            Paths of the objects with the given merge mode, grouped by their template file
+        '''
+
+        groups = {}
+        for path, templateFilePath in self.templates.items():
+            if self.modes[path] == mode:    groups.setdefault(templateFilePath, []).append(path)
+        return groups
+
+    @staticmethod
+    def _write(outFile, path: str, obj):
+
+        dirName, _, objName = path.rpartition('/')
+        outDir = outFile
+        if dirName != '':
+            outDir = outFile.GetDirectory(dirName) or outFile.mkdir(dirName)
+        outDir.WriteObject(obj, objName)
+
+    def merge(self, outFilePath: str) -> list:
+        '''
+            Merge the input files and write the merged objects to the output file,
+            keeping the directory structure of the input files
+
+            Parameters
+            ----------
+            outFilePath (str): path to the output file
+
+            Returns
+            -------
+            list: paths of the objects written to the output file
+        '''
+
+        print(tc.GREEN+'[INFO]: '+tc.RESET+f'Merging {len(self.histPaths)} histograms from {len(self.inFilePaths)} files')
+        summed = self._reduce()
+
+        outFile = TFile(outFilePath, 'RECREATE')
+        written = []
+        # the first file containing each histogram provides its binning, name and title
+        for templateFilePath, paths in self._templateGroups(SUM).items():
+            templateFile = TFile.Open(templateFilePath, 'READ')
+            for path in paths:
+                hist = templateFile.Get(path)
+                hist.SetDirectory(0)
+
+                buffers = summed.pop(path)
+                hist.SetContent(buffers['contents'])
+                if buffers['sumw2'] is not None:
+                    if hist.GetSumw2N() == 0:   hist.Sumw2(True)
+                    hist.GetSumw2().Set(hist.GetNcells(), buffers['sumw2'])
+                hist.PutStats(buffers['stats'])
+                hist.SetEntries(buffers['entries'])
+
+                self._write(outFile, path, hist)
+                written.append(path)
+                hist.Delete()
+            templateFile.Close()
+
+        mergePaths = [path for path, mode in self.modes.items() if mode == MERGE]
+        for path, obj in self._mergeObjects(mergePaths).items():
+            self._write(outFile, path, obj)
+            written.append(path)
+
+        for templateFilePath, paths in self._templateGroups(COPY).items():
+            templateFile = TFile.Open(templateFilePath, 'READ')
+            for path in paths:
+                self._write(outFile, path, templateFile.Get(path))
+                written.append(path)
+            templateFile.Close()
+
+        outFile.Close()
+        print(tc.GREEN+'[INFO]: '+tc.RESET+'Merged output written to '+tc.UNDERLINE+tc.CYAN+f'{outFilePath}'+tc.RESET)
+
+        return written
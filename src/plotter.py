@@ -6,11 +6,14 @@ from ROOT import TCanvas, TFile, TH1F, TLine, TBox, TLegend, TMultiGraph, TGraph
 from ROOT import gStyle, gROOT
 
 from .axis_spec import AxisSpec
+from .hist_handler import HistHandler
 
 class Plotter:
 
     def __init__(self, outPath):
         
+        # the file is recreated: close a cached handle to its previous content
+        HistHandler.fileCache.close(outPath)
         self.outFile = TFile(outPath, 'RECREATE')
         self.canvas = None
         self.hframe = None
@@ -0,0 +1,175 @@
+'''
+    Class to compute derived variables and selection masks on a dataset
+'''
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+# errors raised by numexpr for expressions or dtypes it does not support
+NUMEXPR_UNSUPPORTED = (KeyError, NotImplementedError, SyntaxError, TypeError, ValueError)
+
+from ..utils.terminal_colors import TerminalColors as tc
+
+# functions available in the expressions (minimum, maximum and hypot are not supported by older numexpr versions)
+FUNCTIONS = {name: getattr(np, name) for name in ['sqrt', 'exp', 'log', 'log10', 'abs', 'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan',
+                                                  'arctan2', 'sinh', 'cosh', 'tanh', 'arcsinh', 'arccosh', 'arctanh', 'where', 'minimum', 'maximum', 'hypot']}
+
+
+class _Expression:
+    '''
+        Compiled expression. It is evaluated with numexpr (a single fused pass over the inputs) if available
+        and supported by the expression, with numpy otherwise. The choice is made on the first chunk and kept
+        for the whole dataframe, so that all the rows are computed in the same way
+    '''
+
+    def __init__(self, name: str, expr: str):
+
+        self.name = name
+        self.expr = expr
+        try:
+            self.code = compile(expr, f'<{name}>', 'eval')
+        except SyntaxError as e:
+            raise ValueError(f'Invalid expression for {name}: {expr}') from e
+        self.inputs = [var for var in self.code.co_names if var not in FUNCTIONS]
+        self.reset()
+
+    def reset(self):
+        # None: to be decided on the next evaluation
+        self.useNumexpr = None if ne is not None else False
+
+    def evaluate(self, namespace: dict) -> np.ndarray:
+
+        localDict = {var: namespace[var] for var in self.inputs}
+        if self.useNumexpr is None:
+            try:
+                result = ne.evaluate(self.expr, local_dict=localDict)
+                self.useNumexpr = True
+                return result
+            except NUMEXPR_UNSUPPORTED:
+                self.useNumexpr = False
+        if self.useNumexpr:
+            return ne.evaluate(self.expr, local_dict=localDict)
+        return np.asarray(eval(self.code, {'__builtins__': {}, **FUNCTIONS}, localDict))
+
+
+class Selection:
+    '''
+        Derived variables and cuts, evaluated together in chunks of rows. Expressions use the column
+        names as variables and numpy-style operators (&, |, ~ for the cuts). Derived variables can be
+        used in the following definitions and in the cuts, cuts can be used in the following cuts.
+        The cuts produce boolean masks, that can be reused to fill many histograms without copying the data.
+
+        Parameters
+        ----------
+        definitions (dict): {name: expression} of the derived variables
+        cuts (dict): {name: expression} of the cuts
+        chunkSize (int): number of rows evaluated at once
+    '''
+
+    def __init__(self, definitions: dict = None, cuts: dict = None, chunkSize: int = 1_000_000):
+
+        self.chunkSize = chunkSize
+        self.definitions = {}
+        self.cuts = {}
+        self.masks = {}
+        self._nrows = 0
+        self._combined = {}
+        for name, expr in (definitions if definitions is not None else {}).items():    self.define(name, expr)
+        for name, expr in (cuts if cuts is not None else {}).items():                  self.addCut(name, expr)
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(d.get('definitions', {}), d.get('cuts', {}), d.get('chunkSize', 1_000_000))
+
+    def define(self, name: str, expr: str):
+        '''
+            Add a derived variable
+        '''
+        if name in self.definitions or name in self.cuts:  raise ValueError(f'{name} is already defined')
+        self.definitions[name] = _Expression(name, expr)
+        return self
+
+    def addCut(self, name: str, expr: str):
+        '''
+            Add a cut. The resulting mask is True for the selected rows
+        '''
+        if name in self.definitions or name in self.cuts:  raise ValueError(f'{name} is already defined')
+        self.cuts[name] = _Expression(name, expr)
+        return self
+
+    def evaluate(self, df: pd.DataFrame, addColumns: bool = True) -> dict:
+        '''
+            Evaluate all the derived variables and cuts on the dataframe
+
+            Parameters
+            ----------
+            df (pd.DataFrame): input data
+            addColumns (bool): add the derived variables as columns of df. If False, the derived variables
+                               are only kept for the chunk being evaluated
+
+            Returns
+            -------
+            dict: {cut name: boolean mask}
+        '''
+
+        known = set(df.columns)
+        for expression in list(self.definitions.values()) + list(self.cuts.values()):
+            for var in expression.inputs:
+                if var not in known:
+                    raise ValueError(f'Unknown variable {var} in {expression.name}: {expression.expr}')
+            known.add(expression.name)
+            expression.reset()
+
+        nrows = len(df)
+        columns = {var for expression in list(self.definitions.values()) + list(self.cuts.values())
+                   for var in expression.inputs if var not in self.definitions and var not in self.cuts}
+        inputs = {var: df[var].to_numpy() for var in columns}
+        derived = {name: None for name in self.definitions} if addColumns else {}
+        masks = {name: np.empty(nrows, dtype=bool) for name in self.cuts}
+
+        for start in range(0, nrows, self.chunkSize):
+            stop = min(start + self.chunkSize, nrows)
+            namespace = {var: values[start:stop] for var, values in inputs.items()}
+
+            for name, expression in self.definitions.items():
+                values = expression.evaluate(namespace)
+                if addColumns:
+                    if derived[name] is None:   derived[name] = np.empty(nrows, dtype=values.dtype)
+                    derived[name][start:stop] = values
+                namespace[name] = values
+
+            for name, expression in self.cuts.items():
+                masks[name][start:stop] = expression.evaluate(namespace)
+                namespace[name] = masks[name][start:stop]
+
+        if addColumns:
+            for name, values in derived.items():
+                df[name] = values if values is not None else np.empty(0)
+
+        self.masks = masks
+        self._nrows = nrows
+        self._combined = {}
+        for name, mask in masks.items():
+            print(tc.GREEN+'[INFO]: '+tc.RESET+f'Cut {name}: '+tc.BOLD+f'{np.count_nonzero(mask)}/{nrows}'+tc.RESET+' rows selected')
+        return masks
+
+    def mask(self, *cutNames) -> np.ndarray:
+        '''
+            Logical and of the masks of the given cuts (all the cuts if none is given).
+            Combinations are computed once and reused.
+        '''
+
+        if len(cutNames) == 0:  cutNames = tuple(self.cuts.keys())
+        key = frozenset(cutNames)
+        if key not in self._combined:
+            for name in cutNames:
+                if name not in self.masks:  raise ValueError(f'Cut {name} has not been evaluated')
+            mask = np.ones(self._nrows, dtype=bool)
+            for name in cutNames:   mask &= self.masks[name]
+            self._combined[key] = mask
+        return self._combined[key]
@@ -0,0 +1,94 @@
+'''
+    Dtype handling of TableHandler, with the file reading replaced by in-memory dataframes
+'''
+
+import importlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('uproot')
+pytest.importorskip('hipe4ml')
+
+# the repository is itself a package (its modules use relative imports)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(REPO_DIR))
+PACKAGE = os.path.basename(REPO_DIR)
+TableHandler = importlib.import_module(f'{PACKAGE}.src.data_handler').TableHandler
+
+
+class StubTableHandler(TableHandler):
+    '''
+        TableHandler reading the dataframes from a {path: dataframe} dictionary
+    '''
+
+    def __init__(self, frames: dict, **kwargs):
+        self.frames = frames
+        paths = list(frames.keys())
+        super().__init__(paths if len(paths) > 1 else paths[0], 'O2tree', 'DF', **kwargs)
+
+    def _open(self, inFilePath: str, treeName: str, dirPrefix: str, **kwargs):
+        return self.frames[inFilePath].copy()
+
+
+def test_integer_downcast_keeps_widest_dtype():
+
+    handler = StubTableHandler({'a.root': pd.DataFrame({'n': np.array([1, 2, 3], dtype=np.int64)}),
+                                'b.root': pd.DataFrame({'n': np.array([1, 2, 1000], dtype=np.int64)})}, downcast=True)
+    assert handler.inData['n'].dtype == np.int16
+    assert handler.inData['n'].tolist() == [1, 2, 3, 1, 2, 1000]
+
+def test_downcast_leaves_floats_unless_requested():
+
+    x = np.random.default_rng(1).random(5) * 1e3
+    handler = StubTableHandler({'a.root': pd.DataFrame({'x': x, 'y': x})}, downcast=True, float32Columns=['y'])
+    assert handler.inData['x'].dtype == np.float64
+    assert np.array_equal(handler.inData['x'].to_numpy(), x)
+    assert handler.inData['y'].dtype == np.float32
+
+def test_float32_columns_concat():
+
+    handler = StubTableHandler({'a.root': pd.DataFrame({'x': [1.5, 2.5]}), 'b.root': pd.DataFrame({'x': [3e10]})}, float32Columns=['x'])
+    assert handler.inData['x'].dtype == np.float32
+
+def test_categorical_with_downcast():
+
+    handler = StubTableHandler({'a.root': pd.DataFrame({'cls': np.array([1, 2, 3], dtype=np.int64)}),
+                                'b.root': pd.DataFrame({'cls': np.array([1, 2, 1000], dtype=np.int64)})},
+                               downcast=True, categoricalColumns=['cls'])
+    assert isinstance(handler.inData['cls'].dtype, pd.CategoricalDtype)
+    assert handler.inData['cls'].tolist() == [1, 2, 3, 1, 2, 1000]
+    assert sorted(handler.inData['cls'].cat.categories) == [1, 2, 3, 1000]
+
+def test_categorical_different_categories():
+
+    handler = StubTableHandler({'a.root': pd.DataFrame({'c': ['u', 'v']}), 'b.root': pd.DataFrame({'c': ['w', 'u']})},
+                               categoricalColumns=['c'])
+    assert isinstance(handler.inData['c'].dtype, pd.CategoricalDtype)
+    assert handler.inData['c'].tolist() == ['u', 'v', 'w', 'u']
+
+def test_object_flags_restored_to_bool():
+
+    handler = StubTableHandler({'a.root': pd.DataFrame({'f': np.array([True, False], dtype=object)})})
+    assert handler.inData['f'].dtype == bool
+
+def test_flag_bitfield():
+
+    a = [True, False, True, False]
+    b = [False, True, True, False]
+    handler = StubTableHandler({'a.root': pd.DataFrame({'a': a[:2], 'b': b[:2], 'x': [0., 1.]}),
+                                'b.root': pd.DataFrame({'a': a[2:], 'b': b[2:], 'x': [2., 3.]})}, flagColumns={'flags': ['a', 'b']})
+    assert 'a' not in handler.inData.columns and 'b' not in handler.inData.columns
+    assert handler.inData['flags'].dtype == np.uint8
+    assert handler.getFlag('flags', 'a').tolist() == a
+    assert handler.getFlag('flags', 'b').tolist() == b
+
+def test_memory_usage_per_column():
+
+    handler = StubTableHandler({'a.root': pd.DataFrame({'x': np.zeros(100), 'n': np.zeros(100, dtype=np.int8)})})
+    usage = handler.memoryUsage(verbose=False)
+    assert usage['x'] == 800
+    assert usage['n'] == 100
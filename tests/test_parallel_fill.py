@@ -0,0 +1,100 @@
+'''
+    Compare the chunked/parallel fill of DFHistHandler with a serial TH1::Fill loop
+'''
+
+import importlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = pytest.importorskip('ROOT')
+
+# the repository is itself a package (its modules use relative imports)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(REPO_DIR))
+PACKAGE = os.path.basename(REPO_DIR)
+AxisSpec = importlib.import_module(f'{PACKAGE}.src.axis_spec').AxisSpec
+THist = importlib.import_module(f'{PACKAGE}.src.hist_handler').THist
+fillHist = importlib.import_module(f'{PACKAGE}.src.parallel_fill').fillHist
+
+
+def _content(hist) -> tuple:
+    stats = np.zeros(13, dtype=np.float64)
+    hist.GetStats(stats)
+    contents = np.array([hist.GetBinContent(icell) for icell in range(hist.GetNcells())])
+    return contents, stats, hist.GetEntries()
+
+def _assertIdentical(hist, reference):
+    contents, stats, entries = _content(hist)
+    refContents, refStats, refEntries = _content(reference)
+    assert np.array_equal(contents, refContents)
+    assert np.array_equal(stats, refStats)
+    assert entries == refEntries
+
+
+@pytest.mark.parametrize('nWorkers', [1, 3])
+def test_th1_identical_to_serial_fill(nWorkers):
+
+    x = np.random.default_rng(1).exponential(size=200_000).astype(np.float32)
+    axisSpec = AxisSpec(100, 0., 3., 'hSerial')
+
+    reference = THist([axisSpec]).hist
+    for value in x:  reference.Fill(value)
+    hist = fillHist(THist([AxisSpec(100, 0., 3., 'hParallel')]).hist, [x], [axisSpec], nWorkers=nWorkers, chunkSize=4096)
+
+    _assertIdentical(hist, reference)
+
+@pytest.mark.parametrize('nWorkers', [1, 3])
+def test_th2_identical_to_serial_fill(nWorkers):
+
+    rng = np.random.default_rng(2)
+    x = rng.exponential(size=200_000).astype(np.float32)
+    y = rng.normal(size=200_000)
+    mask = x < 2.5
+    axisSpecX = AxisSpec(40, 0., 2., 'hSerial')
+    axisSpecY = AxisSpec.from_edges([-3., -1., -0.2, 0., 0.3, 1., 3.], 'hSerialY')
+
+    reference = THist([axisSpecX, axisSpecY]).hist
+    for valueX, valueY in zip(x[mask], y[mask]):    reference.Fill(valueX, valueY)
+    hist = THist([AxisSpec(40, 0., 2., 'hParallel'), axisSpecY]).hist
+    hist = fillHist(hist, [x, y], [axisSpecX, axisSpecY], mask, nWorkers=nWorkers, chunkSize=4096)
+
+    _assertIdentical(hist, reference)
+
+def test_th1f_bin_saturation():
+
+    # float bins stop growing at 2^24 entries
+    nrows = (1 << 24) + 5
+    x = np.full(nrows, 0.5)
+    axisSpec = AxisSpec(1, 0., 1., 'hSerialSaturation')
+
+    reference = THist([axisSpec]).hist
+    reference.FillN(nrows, x, np.ones(nrows))
+    hist = fillHist(THist([AxisSpec(1, 0., 1., 'hParallelSaturation')]).hist, [x.astype(np.float32)], [axisSpec], nWorkers=2)
+
+    _assertIdentical(hist, reference)
+
+def test_mask_length_mismatch():
+
+    x = np.zeros(10)
+    axisSpec = AxisSpec(10, 0., 1., 'hMask')
+    with pytest.raises(ValueError):
+        fillHist(THist([axisSpec]).hist, [x], [axisSpec], np.ones(9, dtype=bool), nWorkers=2)
+
+@pytest.mark.parametrize('nWorkers', [1, 3])
+def test_stat_overflows_identical_to_serial_fill(nWorkers):
+
+    # under/overflow entries enter the statistics when requested for the histogram
+    x = np.random.default_rng(3).normal(size=50_000)
+    axisSpec = AxisSpec(50, -1., 1., 'hSerialOverflows')
+
+    reference = THist([axisSpec]).hist
+    reference.SetStatOverflows(ROOT.TH1.kConsider)
+    for value in x:  reference.Fill(value)
+    hist = THist([AxisSpec(50, -1., 1., 'hParallelOverflows')]).hist
+    hist.SetStatOverflows(ROOT.TH1.kConsider)
+    hist = fillHist(hist, [x], [axisSpec], nWorkers=nWorkers, chunkSize=4096)
+
+    _assertIdentical(hist, reference)
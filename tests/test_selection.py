@@ -0,0 +1,98 @@
+'''
+    Derived variables and cut masks computed by Selection
+'''
+
+import importlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the repository is itself a package (its modules use relative imports)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(REPO_DIR))
+PACKAGE = os.path.basename(REPO_DIR)
+selection = importlib.import_module(f'{PACKAGE}.src.selection')
+Selection = selection.Selection
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({'px': rng.normal(size=1000), 'py': rng.normal(size=1000), 'charge': rng.choice([-1, 1], size=1000)})
+
+@pytest.fixture(params=['numexpr', 'numpy'])
+def engine(request, monkeypatch):
+    if request.param == 'numexpr' and selection.ne is None:    pytest.skip('numexpr not available')
+    if request.param == 'numpy':    monkeypatch.setattr(selection, 'ne', None)
+    return request.param
+
+
+def test_definitions_and_cuts(df, engine):
+
+    sel = Selection({'pt': 'sqrt(px**2 + py**2)', 'ptSigned': 'pt * charge'}, {'ptCut': 'pt > 1', 'positive': 'ptSigned > 0'}, chunkSize=128)
+    masks = sel.evaluate(df)
+
+    pt = np.sqrt(df['px']**2 + df['py']**2)
+    assert np.allclose(df['pt'], pt)
+    assert np.allclose(df['ptSigned'], pt * df['charge'])
+    assert np.array_equal(masks['ptCut'], (pt > 1).to_numpy())
+    assert np.array_equal(masks['positive'], (df['charge'] > 0).to_numpy())
+
+def test_cuts_chaining(df, engine):
+
+    sel = Selection(None, {'a': 'px > 0', 'b': 'a & (py < 0.5)'}, chunkSize=100)
+    masks = sel.evaluate(df)
+    assert np.array_equal(masks['b'], ((df['px'] > 0) & (df['py'] < 0.5)).to_numpy())
+
+def test_numpy_only_functions(df, engine):
+
+    sel = Selection({'pmax': 'maximum(abs(px), abs(py))'}, chunkSize=100)
+    sel.evaluate(df)
+    assert np.array_equal(df['pmax'], np.maximum(np.abs(df['px']), np.abs(df['py'])))
+
+def test_no_columns_added(df):
+
+    columns = list(df.columns)
+    sel = Selection({'pt': 'sqrt(px**2 + py**2)'}, {'ptCut': 'pt > 1'}, chunkSize=128)
+    masks = sel.evaluate(df, addColumns=False)
+    assert list(df.columns) == columns
+    assert np.array_equal(masks['ptCut'], (np.sqrt(df['px']**2 + df['py']**2) > 1).to_numpy())
+
+def test_mask_combination_cached(df):
+
+    sel = Selection(None, {'a': 'px > 0', 'b': 'py > 0'})
+    sel.evaluate(df)
+    combined = sel.mask('a', 'b')
+    assert combined is sel.mask('b', 'a')
+    assert np.array_equal(combined, ((df['px'] > 0) & (df['py'] > 0)).to_numpy())
+    assert np.array_equal(sel.mask(), combined)
+
+def test_unknown_variable(df):
+
+    with pytest.raises(ValueError):
+        Selection({'pt': 'sqrt(px**2 + pz**2)'}).evaluate(df)
+    # cuts can only use the cuts defined before them
+    with pytest.raises(ValueError):
+        Selection(None, {'b': 'a & (py < 0)', 'a': 'px > 0'}).evaluate(df)
+
+def test_mask_not_evaluated():
+
+    with pytest.raises(ValueError):
+        Selection(None, {'a': 'px > 0'}).mask('a')
+
+def test_invalid_expression():
+
+    with pytest.raises(ValueError):
+        Selection({'pt': 'sqrt(px**2 +'})
+
+def test_empty_dataframe(engine):
+
+    df = pd.DataFrame({'px': np.array([], dtype=np.float64)})
+    sel = Selection({'px2': 'px * 2'}, {'a': 'px > 0'})
+    masks = sel.evaluate(df)
+    assert len(masks['a']) == 0
+    assert len(df['px2']) == 0
+    assert len(sel.mask()) == 0